@@ -4,13 +4,19 @@
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import json
 import base64
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
 import os
+import sys
 from datetime import datetime
 
+# the ledger engine lives with the other DSA code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dsa'))
+from ledger import BalanceLedger, normalize_timestamp, parse_ledger_fields
+
 # global storage for transactions
 all_transactions = []
 trans_dict = {}  # for faster lookups
+ledger = BalanceLedger()  # balance checkpoints for /ledger queries
 
 # login credentials for basic auth
 USERS = {
@@ -93,7 +99,8 @@ class TransactionAPI(BaseHTTPRequestHandler):
             self.send_error_response(401, 'Unauthorized - Invalid or missing credentials')
             return
         
-        path = urlparse(self.path).path
+        parsed = urlparse(self.path)
+        path = parsed.path
         print(f"GET request for: {path}")
         
         # list all transactions
@@ -124,6 +131,51 @@ class TransactionAPI(BaseHTTPRequestHandler):
                 self.send_error_response(404, f'Transaction {trans_id} not found')
             return
         
+        # balance at a point in time, e.g. /ledger/balance?at=2024-06-01
+        if path == '/ledger/balance':
+            params = parse_qs(parsed.query)
+            if 'at' not in params:
+                self.send_error_response(400, 'Missing query parameter: at')
+                return
+            try:
+                at = normalize_timestamp(params['at'][0])
+            except ValueError:
+                self.send_error_response(400, 'Invalid timestamp, use ISO format (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS) without a timezone')
+                return
+
+            response = {
+                'success': True,
+                'data': ledger.balance_at(at)
+            }
+            self.send_json_response(response)
+            return
+
+        # reconcile a time window, e.g. /ledger/verify?start=2024-05-01&end=2024-05-31
+        # a date on its own as the end means the whole of that day
+        if path == '/ledger/verify':
+            params = parse_qs(parsed.query)
+            try:
+                start = None
+                end = None
+                if 'start' in params:
+                    start = normalize_timestamp(params['start'][0])
+                if 'end' in params:
+                    end = normalize_timestamp(params['end'][0], end_of_day=True)
+            except ValueError:
+                self.send_error_response(400, 'Invalid timestamp, use ISO format (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS) without a timezone')
+                return
+
+            if start and end and start > end:
+                self.send_error_response(400, 'start must not be after end')
+                return
+
+            response = {
+                'success': True,
+                'data': ledger.verify(start, end)
+            }
+            self.send_json_response(response)
+            return
+        
         # unknown endpoint
         self.send_error_response(404, 'Endpoint not found')
     
@@ -153,6 +205,13 @@ class TransactionAPI(BaseHTTPRequestHandler):
                     self.send_error_response(400, f'Missing fields: {", ".join(missing)}')
                     return
                 
+                # check and convert the amount, fee, balance and timestamp
+                try:
+                    new_trans.update(parse_ledger_fields(new_trans))
+                except ValueError as e:
+                    self.send_error_response(400, str(e))
+                    return
+                
                 # generate new ID
                 if len(all_transactions) > 0:
                     max_id = max([int(t['id']) for t in all_transactions])
@@ -171,6 +230,7 @@ class TransactionAPI(BaseHTTPRequestHandler):
                     new_trans['status'] = 'pending'
                 
                 # add to storage
+                ledger.add(new_trans)
                 all_transactions.append(new_trans)
                 trans_dict[new_id] = new_trans
                 
@@ -215,10 +275,21 @@ class TransactionAPI(BaseHTTPRequestHandler):
                     self.send_error_response(404, f'Transaction {trans_id} not found')
                     return
                 
-                # update fields (don't allow ID changes)
+                # check and convert the amount, fee, balance and timestamp
+                try:
+                    update_data.update(parse_ledger_fields(update_data))
+                except ValueError as e:
+                    self.send_error_response(400, str(e))
+                    return
+                
+                # apply the changes to a copy (don't allow ID changes) and update
+                # the ledger first so a failure leaves nothing half changed
+                updated = dict(transaction)
                 for key in update_data:
                     if key != 'id':
-                        transaction[key] = update_data[key]
+                        updated[key] = update_data[key]
+                ledger.update(updated)
+                transaction.update(updated)
                 
                 print(f"Updated transaction {trans_id}")
 
@@ -263,6 +334,7 @@ class TransactionAPI(BaseHTTPRequestHandler):
             # remove from both storage locations
             all_transactions = [t for t in all_transactions if t['id'] != trans_id]
             del trans_dict[trans_id]
+            ledger.remove(trans_id)
             
             print(f"Deleted transaction {trans_id}")
 
@@ -281,7 +353,7 @@ class TransactionAPI(BaseHTTPRequestHandler):
 
 def load_data():
     # load transactions from JSON file
-    global all_transactions, trans_dict
+    global all_transactions, trans_dict, ledger
     
     try:
         with open('transactions.json', 'r') as f:
@@ -291,6 +363,9 @@ def load_data():
         trans_dict = {}
         for trans in all_transactions:
             trans_dict[trans['id']] = trans
+
+        # replay the balances once so ledger queries only need a short replay
+        ledger = BalanceLedger(all_transactions)
             
         print(f"Loaded {len(all_transactions)} transactions from file")
     except FileNotFoundError:
@@ -298,6 +373,7 @@ def load_data():
         print("Run xml_parser.py first to generate the data")
         all_transactions = []
         trans_dict = {}
+        ledger = BalanceLedger()
 
 
 def save_data():
@@ -325,6 +401,8 @@ def start_server(port=8000):
     print("  POST   /transactions       - Create new")
     print("  PUT    /transactions/{{id}}  - Update")
     print("  DELETE /transactions/{{id}}  - Delete")
+    print("  GET    /ledger/balance?at=T - Balance at time T")
+    print("  GET    /ledger/verify       - Reconcile a time window (?start=&end=)")
     print("\nTest credentials:")
     print("  admin:password123")
     print("  user:userpass")
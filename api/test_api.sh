@@ -57,6 +57,16 @@ curl -X GET "$API_URL/transactions" \
   -H "Authorization: Basic $(echo -n 'wrong:credentials' | base64)" \
   -w "\nStatus: %{http_code}\n\n"
 
+echo -e "\n8. Testing GET /ledger/balance (Balance at a Point in Time)"
+curl -X GET "$API_URL/ledger/balance?at=2024-06-01" \
+  -H "Authorization: Basic $(echo -n $AUTH | base64)" \
+  -w "\nStatus: %{http_code}\n\n"
+
+echo -e "\n9. Testing GET /ledger/verify (Reconcile a Time Window)"
+curl -X GET "$API_URL/ledger/verify?start=2024-05-14&end=2024-05-15" \
+  -H "Authorization: Basic $(echo -n $AUTH | base64)" \
+  -w "\nStatus: %{http_code}\n\n"
+
 echo -e "\n======================================"
 echo "Test Suite Complete"
 echo "======================================"
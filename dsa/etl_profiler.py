@@ -0,0 +1,141 @@
+# Opt-in profiling for the XML -> JSON pipeline in xml_parser.py
+# Records wall/CPU time per stage so we can see which part is slow
+
+import time
+import json
+import heapq
+import platform
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+def peak_rss_kb():
+    # peak resident memory of this process in KB (None if we can't tell)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    if platform.system() == 'Darwin':
+        peak = peak // 1024
+    return peak
+
+
+class StageProfiler:
+
+    def __init__(self, slowest_count=10, sample_count=5):
+        self.stages = {}        # stage name -> wall, cpu, records, calls
+        self.stage_order = []   # keep stages in the order they first ran
+        self.slowest = []       # min-heap of (seconds, seq, type, body)
+        self.slowest_count = slowest_count
+        self.sample_count = sample_count
+        self.type_counts = {}
+        self.other_count = 0
+        self.other_samples = []
+        self.seq = 0
+        self.run_start = self.start()
+
+    def start(self):
+        # take a (wall, cpu) reading to pass back into stop()
+        return (time.perf_counter(), time.process_time())
+
+    def stop(self, name, mark, records=1):
+        # add the time since mark to the named stage, returns wall seconds
+        wall = time.perf_counter() - mark[0]
+        cpu = time.process_time() - mark[1]
+
+        if name not in self.stages:
+            self.stages[name] = {'wall_time': 0.0, 'cpu_time': 0.0, 'records': 0, 'calls': 0}
+            self.stage_order.append(name)
+
+        stage = self.stages[name]
+        stage['wall_time'] += wall
+        stage['cpu_time'] += cpu
+        stage['records'] += records
+        stage['calls'] += 1
+        return wall
+
+    def record_message(self, body, trans_type, seconds):
+        # track per-message extraction cost and unmatched messages
+        self.type_counts[trans_type] = self.type_counts.get(trans_type, 0) + 1
+
+        if trans_type == 'OTHER':
+            self.other_count += 1
+            if len(self.other_samples) < self.sample_count:
+                self.other_samples.append(body[:200])
+
+        # seq breaks ties so heapq never compares the strings
+        self.seq += 1
+        entry = (seconds, self.seq, trans_type, body[:200])
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def build_report(self):
+        # put everything together in a JSON friendly dict
+        total_wall = time.perf_counter() - self.run_start[0]
+        total_cpu = time.process_time() - self.run_start[1]
+
+        stages = {}
+        for name in self.stage_order:
+            stage = self.stages[name]
+            wall = stage['wall_time']
+            if wall > 0:
+                per_sec = stage['records'] / wall
+            else:
+                per_sec = 0
+            stages[name] = {
+                'wall_time': wall,
+                'cpu_time': stage['cpu_time'],
+                'records': stage['records'],
+                'calls': stage['calls'],
+                'records_per_sec': per_sec,
+                'share_of_total': wall / total_wall if total_wall > 0 else 0
+            }
+
+        slowest = []
+        for seconds, seq, trans_type, body in sorted(self.slowest, reverse=True):
+            slowest.append({
+                'seconds': seconds,
+                'type': trans_type,
+                'body': body
+            })
+
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'total_wall_time': total_wall,
+            'total_cpu_time': total_cpu,
+            'peak_rss_kb': peak_rss_kb(),
+            'stages': stages,
+            'transaction_types': self.type_counts,
+            'unmatched': {
+                'count': self.other_count,
+                'samples': self.other_samples
+            },
+            'slowest_messages': slowest
+        }
+
+    def save_report(self, output_file):
+        report = self.build_report()
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def print_summary(self, report):
+        # short table on the console, the JSON file has the details
+        print("\n" + "="*60)
+        print("ETL PROFILE")
+        print("="*60)
+        print(f"{'stage':<14}{'wall (s)':>12}{'cpu (s)':>12}{'records':>10}{'rec/s':>12}")
+        for name, stage in report['stages'].items():
+            print(f"{name:<14}{stage['wall_time']:>12.6f}{stage['cpu_time']:>12.6f}"
+                  f"{stage['records']:>10}{stage['records_per_sec']:>12.0f}")
+        print(f"\nTotal wall time: {report['total_wall_time']:.6f} seconds")
+        print(f"Total CPU time:  {report['total_cpu_time']:.6f} seconds")
+        if report['peak_rss_kb'] is not None:
+            print(f"Peak RSS:        {report['peak_rss_kb']} KB")
+        print(f"Unmatched (OTHER) messages: {report['unmatched']['count']}")
+        print("="*60)
@@ -0,0 +1,408 @@
+# Balance ledger reconciliation for the parsed MoMo transactions
+# Every SMS reports the balance after the transaction, so we can replay the
+# ledger (previous balance +/- amount and fee) and flag messages where the
+# reported balance doesn't add up -> usually a missing SMS in the backup.
+#
+# The ledger is ordered by when the transaction happened (the time in the
+# SMS body), not when the SMS arrived, because messages are often delivered
+# out of order. Entries with the same time keep the order of the file.
+#
+# Instead of keeping a balance for every entry we keep a checkpoint every
+# CHECKPOINT_INTERVAL entries. "Balance at time T" is then a bisect on the
+# entry times to find the entry, then a short replay from the checkpoint
+# before it (at most CHECKPOINT_INTERVAL entries).
+
+import bisect
+import json
+import math
+import os
+from datetime import date, datetime
+
+CHECKPOINT_INTERVAL = 50
+
+# transaction types that add money / take money out of the account
+CREDIT_TYPES = ('RECEIVE', 'DEPOSIT')
+DEBIT_TYPES = ('SEND', 'AIRTIME', 'WITHDRAW')
+
+# balances are in RWF, anything below this is rounding noise
+TOLERANCE = 0.01
+
+
+def normalize_timestamp(value, end_of_day=False):
+    # turn '2024-05-10' or '2024-05-10 16:30:51' into the ISO format the
+    # parser uses so plain string comparison works. raises ValueError
+    # with end_of_day a date on its own means the last moment of that day
+    if not isinstance(value, str):
+        raise ValueError('timestamp must be a string')
+    value = value.strip()
+    parsed = datetime.fromisoformat(value)
+    # stored times are naive local times, an offset would compare wrongly
+    if parsed.tzinfo is not None:
+        raise ValueError('timestamp must not have a timezone')
+    if end_of_day:
+        try:
+            day = date.fromisoformat(value)
+        except ValueError:
+            day = None
+        if day:
+            parsed = datetime.combine(day, datetime.max.time())
+    return parsed.isoformat()
+
+
+def to_number(value, field):
+    # amounts come from JSON so they can be numbers or numeric strings
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f'{field} must be a number')
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'{field} must be a number')
+    if not math.isfinite(number):
+        raise ValueError(f'{field} must be a number')
+    return number
+
+
+def parse_ledger_fields(data):
+    # check and convert the fields the ledger uses, raises ValueError on bad
+    # input so the API can reject it before changing anything
+    result = {}
+    if 'amount' in data:
+        result['amount'] = to_number(data['amount'], 'amount')
+    if 'fee' in data:
+        result['fee'] = to_number(data['fee'], 'fee')
+    if 'balance_after' in data:
+        if data['balance_after'] is None:
+            result['balance_after'] = None
+        else:
+            result['balance_after'] = to_number(data['balance_after'], 'balance_after')
+    for field in ('timestamp', 'transaction_time'):
+        if field not in data:
+            continue
+        if field == 'transaction_time' and data[field] is None:
+            result[field] = None
+            continue
+        try:
+            result[field] = normalize_timestamp(data[field])
+        except ValueError:
+            raise ValueError(f'{field} must be ISO format (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS) without a timezone')
+    return result
+
+
+def make_entry(trans, seq):
+    # only keep the fields the ledger needs, raises ValueError on bad values
+    # seq is the position in the transactions list, it breaks ties on time
+    fields = parse_ledger_fields(trans)
+    timestamp = fields.get('timestamp', '')
+    return {
+        'id': str(trans['id']),
+        'seq': seq,
+        'time': fields.get('transaction_time') or timestamp,
+        'timestamp': timestamp,
+        'type': trans.get('type', ''),
+        'amount': fields.get('amount', 0.0),
+        'fee': fields.get('fee', 0.0),
+        'balance_after': fields.get('balance_after')
+    }
+
+
+def signed_change(entry):
+    # how much this entry should move the balance by (None if we can't tell)
+    if entry['type'] in CREDIT_TYPES:
+        return entry['amount']
+    if entry['type'] in DEBIT_TYPES:
+        return -(entry['amount'] + entry['fee'])
+    return None
+
+
+def apply_entry(balance, entry):
+    # replay one entry, returns (new balance, issue or None)
+    change = signed_change(entry)
+    reported = entry['balance_after']
+
+    # nothing to compare against yet, the first reported balance seeds the ledger
+    if balance is None:
+        return reported, None
+
+    if change is None:
+        expected = balance
+    else:
+        expected = balance + change
+
+    # API created transactions usually don't carry a balance
+    if reported is None:
+        return expected, None
+
+    difference = reported - expected
+    if abs(difference) <= TOLERANCE:
+        return reported, None
+
+    # an OTHER message has no direction to check against, otherwise the same
+    # money in the other direction means the type was guessed wrong, and
+    # anything else is money that moved without a message for it
+    credit = balance + entry['amount']
+    debit = balance - (entry['amount'] + entry['fee'])
+    if change is None:
+        kind = 'unclassified'
+    elif abs(reported - credit) <= TOLERANCE or abs(reported - debit) <= TOLERANCE:
+        kind = 'direction'
+    else:
+        kind = 'gap'
+
+    issue = {
+        'kind': kind,
+        'transaction_id': entry['id'],
+        'transaction_time': entry['time'],
+        'timestamp': entry['timestamp'],
+        'type': entry['type'],
+        'previous_balance': balance,
+        'expected_balance': expected,
+        'reported_balance': reported,
+        'difference': difference
+    }
+    # the SMS balance is what the operator says, continue from it
+    return reported, issue
+
+
+class BalanceLedger:
+
+    def __init__(self, transactions=None, interval=CHECKPOINT_INTERVAL):
+        self.interval = interval
+        self.entries = []       # sorted by (time, seq)
+        self.keys = []          # (time, seq) of each entry, kept in step for bisect
+        self.next_seq = 0       # seq for the next added transaction
+        # checkpoints[k] is the balance before entries[k * interval]
+        self.checkpoints = []
+        self.tail_balance = None  # balance after the last entry
+        self.rejected = []      # ids of transactions with unusable values
+        if transactions:
+            self.rebuild(transactions)
+
+    def rebuild(self, transactions):
+        # load everything and replay from scratch
+        entries = []
+        self.rejected = []
+        for seq, trans in enumerate(transactions):
+            try:
+                entries.append(make_entry(trans, seq))
+            except ValueError:
+                self.rejected.append(str(trans.get('id')))
+        entries.sort(key=lambda e: (e['time'], e['seq']))
+        self.entries = entries
+        self.keys = [(e['time'], e['seq']) for e in entries]
+        self.next_seq = len(transactions)
+        self.checkpoints = []
+        self.tail_balance = None
+        self.replay_from(0)
+
+    def replay_from(self, index):
+        # recompute checkpoints from the checkpoint at or before index
+        block = index // self.interval
+        del self.checkpoints[block:]
+        if block > 0:
+            # balance before this block = replay the previous block
+            balance = self.balance_through(block * self.interval - 1)
+        else:
+            balance = None
+
+        for i in range(block * self.interval, len(self.entries)):
+            if i % self.interval == 0:
+                self.checkpoints.append(balance)
+            balance, issue = apply_entry(balance, self.entries[i])
+        self.tail_balance = balance
+
+    def balance_through(self, index):
+        # balance right after entries[index], replaying from its checkpoint
+        block = index // self.interval
+        balance = self.checkpoints[block]
+        for i in range(block * self.interval, index + 1):
+            balance, issue = apply_entry(balance, self.entries[i])
+        return balance
+
+    def insert_entry(self, entry):
+        # put an entry in its place, only replays from the affected checkpoint
+        key = (entry['time'], entry['seq'])
+        pos = bisect.bisect_right(self.keys, key)
+        self.entries.insert(pos, entry)
+        self.keys.insert(pos, key)
+
+        if pos == len(self.entries) - 1:
+            # appended at the end (the usual case), no replay needed
+            if pos % self.interval == 0:
+                self.checkpoints.append(self.tail_balance)
+            self.tail_balance, issue = apply_entry(self.tail_balance, entry)
+        else:
+            self.replay_from(pos)
+
+    def find(self, trans_id):
+        # position of a transaction in the ledger, or None
+        trans_id = str(trans_id)
+        for pos in range(len(self.entries)):
+            if self.entries[pos]['id'] == trans_id:
+                return pos
+        return None
+
+    def add(self, trans):
+        # a new transaction goes after everything already loaded, like
+        # all_transactions.append() in the API
+        entry = make_entry(trans, self.next_seq)
+        self.next_seq += 1
+        self.insert_entry(entry)
+
+    def remove(self, trans_id):
+        # drop a transaction by id, returns False if it wasn't in the ledger
+        pos = self.find(trans_id)
+        if pos is None:
+            return False
+        del self.entries[pos]
+        del self.keys[pos]
+        self.replay_from(pos)
+        return True
+
+    def update(self, trans):
+        # make_entry runs first so bad values leave the ledger untouched
+        pos = self.find(trans['id'])
+        if pos is None:
+            self.add(trans)
+            return
+
+        # keep the seq so the entry stays where a rebuild would put it
+        entry = make_entry(trans, self.entries[pos]['seq'])
+        if entry['time'] == self.entries[pos]['time']:
+            self.entries[pos] = entry
+            self.replay_from(pos)
+            return
+
+        del self.entries[pos]
+        del self.keys[pos]
+        self.replay_from(pos)
+        self.insert_entry(entry)
+
+    def balance_at(self, timestamp):
+        # balance as of the given ISO timestamp (None if it's before the first entry)
+        pos = bisect.bisect_right(self.keys, (timestamp, math.inf)) - 1
+        if pos < 0:
+            return {
+                'timestamp': timestamp,
+                'balance': None,
+                'as_of_transaction': None,
+                'as_of_timestamp': None,
+                'replayed': 0
+            }
+
+        balance = self.balance_through(pos)
+        return {
+            'timestamp': timestamp,
+            'balance': balance,
+            'as_of_transaction': self.entries[pos]['id'],
+            'as_of_timestamp': self.entries[pos]['time'],
+            'replayed': pos % self.interval + 1
+        }
+
+    def verify(self, start=None, end=None):
+        # replay the entries between start and end (inclusive) and flag issues
+        if start is None:
+            first = 0
+        else:
+            first = bisect.bisect_left(self.keys, (start, -1))
+        if end is None:
+            last = len(self.entries)
+        else:
+            last = bisect.bisect_right(self.keys, (end, math.inf))
+        # an end before the start is an empty window
+        last = max(last, first)
+
+        if first > 0:
+            balance = self.balance_through(first - 1)
+        else:
+            balance = None
+        opening = balance
+
+        issues = []
+        skipped = 0
+        for i in range(first, last):
+            entry = self.entries[i]
+            if entry['balance_after'] is None:
+                skipped += 1
+            balance, issue = apply_entry(balance, entry)
+            if issue:
+                issues.append(issue)
+
+        return {
+            'start': start,
+            'end': end,
+            'entries_checked': last - first,
+            'without_balance': skipped,
+            'opening_balance': opening,
+            'closing_balance': balance,
+            'gaps': len([i for i in issues if i['kind'] == 'gap']),
+            'direction_mismatches': len([i for i in issues if i['kind'] == 'direction']),
+            'unclassified': len([i for i in issues if i['kind'] == 'unclassified']),
+            'issues': issues
+        }
+
+    def checkpoint_list(self):
+        # checkpoints with the entry they sit in front of, for saving/inspection
+        result = []
+        for block in range(len(self.checkpoints)):
+            index = block * self.interval
+            result.append({
+                'index': index,
+                'transaction_time': self.entries[index]['time'],
+                'transaction_id': self.entries[index]['id'],
+                'balance_before': self.checkpoints[block]
+            })
+        return result
+
+
+def run_reconciliation():
+    # reconcile the whole ledger and save the report
+    print("Loading transactions from JSON file...")
+    if os.path.exists('api/transactions.json'):
+        path = 'api/transactions.json'
+    elif os.path.exists('../api/transactions.json'):
+        path = '../api/transactions.json'
+    else:
+        print("ERROR: transactions.json not found!")
+        print("You need to run xml_parser.py first")
+        return
+
+    with open(path, 'r') as f:
+        transactions = json.load(f)
+
+    ledger = BalanceLedger(transactions)
+    report = ledger.verify()
+    report['rejected'] = ledger.rejected
+    report['checkpoint_interval'] = ledger.interval
+    report['checkpoints'] = ledger.checkpoint_list()
+
+    print("="*60)
+    print("BALANCE LEDGER RECONCILIATION")
+    print("="*60)
+    print(f"Entries checked:       {report['entries_checked']}")
+    print(f"Without a balance:     {report['without_balance']}")
+    print(f"Closing balance:       {report['closing_balance']} RWF")
+    print(f"Gaps (missing money):  {report['gaps']}")
+    print(f"Type/direction errors: {report['direction_mismatches']}")
+    print(f"Unclassified (OTHER):  {report['unclassified']}")
+    print(f"Checkpoints stored:    {len(report['checkpoints'])} (every {ledger.interval} entries)")
+
+    gaps = [i for i in report['issues'] if i['kind'] == 'gap']
+    if gaps:
+        print("\nFirst gaps found:")
+        for issue in gaps[:5]:
+            print(f"  {issue['transaction_time']}  {issue['transaction_id']:<12} "
+                  f"expected {issue['expected_balance']:.0f}, SMS says {issue['reported_balance']:.0f} "
+                  f"({issue['difference']:+.0f} RWF unaccounted)")
+
+    if os.path.exists('dsa'):
+        output_file = 'dsa/reconciliation_report.json'
+    else:
+        output_file = 'reconciliation_report.json'
+
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {output_file}")
+
+
+if __name__ == "__main__":
+    run_reconciliation()
@@ -0,0 +1,127 @@
+# Checks for the balance ledger in ledger.py
+# The incremental add/remove/update must always end up with the same
+# entries and checkpoints as rebuilding the ledger from scratch.
+# Run from the project root: python3 dsa/test_ledger.py (or pytest)
+
+import random
+import unittest
+
+from ledger import BalanceLedger, apply_entry, normalize_timestamp
+from xml_parser import extract_transaction_info
+
+
+def make_transactions(count, rng):
+    # small fake ledger with lots of equal times and some missing balances
+    transactions = []
+    balance = 10000.0
+    for i in range(count):
+        ttype = rng.choice(['SEND', 'RECEIVE', 'DEPOSIT', 'OTHER'])
+        amount = float(rng.randint(1, 20) * 100)
+        fee = 0.0 if ttype != 'SEND' else float(rng.choice([0, 20, 100]))
+        if ttype == 'SEND':
+            balance -= amount + fee
+        elif ttype != 'OTHER':
+            balance += amount
+        # every so often the balance jumps (a "missing" message)
+        if rng.random() < 0.1:
+            balance += 500
+        balance_after = balance if rng.random() > 0.2 else None
+        transactions.append({
+            'id': str(i + 1),
+            'type': ttype,
+            'amount': amount,
+            'fee': fee,
+            'balance_after': balance_after,
+            'timestamp': f"2024-05-{rng.randint(10, 12)}T10:00:{rng.randint(0, 59):02d}",
+            'transaction_time': f"2024-05-{rng.randint(10, 12)}T10:00:{rng.choice([0, 30]):02d}"
+        })
+    return transactions
+
+
+class LedgerTest(unittest.TestCase):
+
+    def assert_same_as_rebuild(self, ledger, transactions):
+        fresh = BalanceLedger(transactions, interval=ledger.interval)
+        self.assertEqual([e['id'] for e in ledger.entries], [e['id'] for e in fresh.entries])
+        self.assertEqual(ledger.checkpoints, fresh.checkpoints)
+        self.assertEqual(ledger.tail_balance, fresh.tail_balance)
+        self.assertEqual(ledger.verify()['issues'], fresh.verify()['issues'])
+
+    def test_incremental_matches_rebuild(self):
+        rng = random.Random(7)
+        for interval in (1, 3, 5):
+            transactions = make_transactions(20, rng)
+            ledger = BalanceLedger(transactions, interval=interval)
+            next_id = 100
+            for step in range(300):
+                op = rng.choice(['add', 'remove', 'update_same', 'update_time'])
+                if op == 'add' or not transactions:
+                    trans = make_transactions(1, rng)[0]
+                    trans['id'] = str(next_id)
+                    next_id += 1
+                    transactions.append(trans)
+                    ledger.add(trans)
+                elif op == 'remove':
+                    trans = transactions.pop(rng.randrange(len(transactions)))
+                    self.assertTrue(ledger.remove(trans['id']))
+                else:
+                    trans = rng.choice(transactions)
+                    trans['amount'] = float(rng.randint(1, 20) * 100)
+                    trans['balance_after'] = rng.choice([None, 5000.0, trans['balance_after']])
+                    if op == 'update_time':
+                        trans['transaction_time'] = f"2024-05-{rng.randint(10, 12)}T10:00:{rng.choice([0, 30]):02d}"
+                    ledger.update(dict(trans))
+                self.assert_same_as_rebuild(ledger, transactions)
+
+    def test_balance_at_matches_full_replay(self):
+        rng = random.Random(3)
+        transactions = make_transactions(60, rng)
+        ledger = BalanceLedger(transactions, interval=7)
+        for time in ['2024-05-09T00:00:00'] + [e['time'] for e in ledger.entries]:
+            balance = None
+            for entry in ledger.entries:
+                if entry['time'] <= time:
+                    balance, issue = apply_entry(balance, entry)
+            self.assertEqual(ledger.balance_at(time)['balance'], balance)
+
+    def test_orders_by_transaction_time(self):
+        # the deposit SMS arrived after the payment SMS, but happened first
+        transactions = [
+            {'id': 'a', 'type': 'DEPOSIT', 'amount': 1000.0, 'balance_after': 1000.0,
+             'timestamp': '2024-06-22T10:40:00', 'transaction_time': '2024-06-22T10:40:00'},
+            {'id': 'b', 'type': 'SEND', 'amount': 500.0, 'fee': 0.0, 'balance_after': 5500.0,
+             'timestamp': '2024-06-22T10:49:08', 'transaction_time': '2024-06-22T10:49:01'},
+            {'id': 'c', 'type': 'DEPOSIT', 'amount': 5000.0, 'balance_after': 6000.0,
+             'timestamp': '2024-06-22T10:49:39', 'transaction_time': '2024-06-22T10:48:17'},
+        ]
+        ledger = BalanceLedger(transactions)
+        self.assertEqual([e['id'] for e in ledger.entries], ['a', 'c', 'b'])
+        self.assertEqual(ledger.verify()['issues'], [])
+
+    def test_verify_window(self):
+        rng = random.Random(5)
+        ledger = BalanceLedger(make_transactions(30, rng), interval=4)
+        self.assertEqual(ledger.verify('2024-05-12T00:00:00', '2024-05-10T00:00:00')['entries_checked'], 0)
+        day = ledger.verify(normalize_timestamp('2024-05-11'), normalize_timestamp('2024-05-11', end_of_day=True))
+        expected = len([e for e in ledger.entries if e['time'].startswith('2024-05-11')])
+        self.assertEqual(day['entries_checked'], expected)
+
+    def test_normalize_timestamp(self):
+        self.assertEqual(normalize_timestamp('2024-06-01 10:00:00'), '2024-06-01T10:00:00')
+        self.assertEqual(normalize_timestamp('2024-05-15', end_of_day=True), '2024-05-15T23:59:59.999999')
+        self.assertEqual(normalize_timestamp('2024-05-15T08:00', end_of_day=True), '2024-05-15T08:00:00')
+        for bad in ['2024-06-22T10:49:20+02:00', 'yesterday', 5]:
+            with self.assertRaises(ValueError):
+                normalize_timestamp(bad)
+
+    def test_parser_keeps_transaction_time(self):
+        trans = extract_transaction_info(
+            "*113*R*A bank deposit of 5000 RWF has been added to your mobile money account at "
+            "2024-06-22 10:48:17. Your NEW BALANCE :14940 RWF. Cash Deposit::CASH::::0::250795963036.",
+            '2024-06-22T10:49:39.822000')
+        self.assertEqual(trans['transaction_time'], '2024-06-22T10:48:17')
+        self.assertEqual(trans['balance_after'], 14940.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
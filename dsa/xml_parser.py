@@ -3,6 +3,7 @@
 
 import xml.etree.ElementTree as ET
 import json
+import argparse
 import re
 from datetime import datetime
 
@@ -12,9 +13,12 @@ def extract_transaction_info(body_text, date_str):
         'id': None,
         'type': '',
         'amount': 0.0,
+        'fee': 0.0,
+        'balance_after': None,
         'sender': '',
         'receiver': '',
         'timestamp': date_str,
+        'transaction_time': None,
         'status': 'completed'
     }
     
@@ -35,6 +39,23 @@ def extract_transaction_info(body_text, date_str):
         amount_str = amount_match.group(1).replace(',', '')
         trans['amount'] = float(amount_str)
     
+    # extract the fee ("Fee was 0 RWF", "Fee was: 100 RWF" or "Fee paid: 350 RWF")
+    fee_match = re.search(r'Fee (?:was|paid):?\s*(\d{1,3}(?:,\d{3})*|\d+)\s*RWF', body_text, re.IGNORECASE)
+    if fee_match:
+        trans['fee'] = float(fee_match.group(1).replace(',', ''))
+    
+    # extract the balance after the transaction ("Your new balance: 1,000 RWF",
+    # "Your NEW BALANCE :40400 RWF", "New balance: 28300 RWF")
+    balance_match = re.search(r'new balance\s*:\s*(\d{1,3}(?:,\d{3})*|\d+)\s*RWF', body_text, re.IGNORECASE)
+    if balance_match:
+        trans['balance_after'] = float(balance_match.group(1).replace(',', ''))
+    
+    # the time the transaction happened ("at 2024-05-10 16:30:51"), the SMS
+    # can arrive later and out of order so the ledger sorts on this one
+    time_match = re.search(r'(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2})', body_text)
+    if time_match:
+        trans['transaction_time'] = f"{time_match.group(1)}T{time_match.group(2)}"
+    
     # figure out transaction type from the message
     body_lower = body_text.lower()
     
@@ -85,11 +106,16 @@ def extract_transaction_info(body_text, date_str):
     return trans
 
 
-def parse_xml_to_json(xml_file):
+def parse_xml_to_json(xml_file, profiler=None):
     # parse the MTN mobile money XML backup file
+    # profiler is an optional StageProfiler (see etl_profiler.py)
     try:
+        if profiler:
+            mark = profiler.start()
         tree = ET.parse(xml_file)
         root = tree.getroot()
+        if profiler:
+            profiler.stop('xml_parse', mark, records=len(root))
         
         transactions = []
         counter = 1  # for generating IDs
@@ -108,14 +134,22 @@ def parse_xml_to_json(xml_file):
                 continue
             
             # convert timestamp
+            if profiler:
+                mark = profiler.start()
             try:
                 timestamp_sec = int(date_ms) / 1000
                 date_str = datetime.fromtimestamp(timestamp_sec).isoformat()
             except:
                 date_str = readable_date
+            if profiler:
+                profiler.stop('timestamp', mark)
+                mark = profiler.start()
             
             # extract transaction info from the SMS body
             trans = extract_transaction_info(body, date_str)
+            if profiler:
+                seconds = profiler.stop('extract', mark)
+                profiler.record_message(body, trans['type'], seconds)
             
             # assign ID if not found in body
             if not trans['id']:
@@ -140,11 +174,15 @@ def parse_xml_to_json(xml_file):
         return []
 
 
-def save_to_json(trans_list, output_file):
+def save_to_json(trans_list, output_file, profiler=None):
     # save the transactions to a json file
     try:
+        if profiler:
+            mark = profiler.start()
         with open(output_file, 'w') as f:
             json.dump(trans_list, f, indent=2)
+        if profiler:
+            profiler.stop('json_dump', mark, records=len(trans_list))
         print(f"Saved {len(trans_list)} transactions to {output_file}")
     except Exception as e:
         print(f"Error saving: {e}")
@@ -152,14 +190,33 @@ def save_to_json(trans_list, output_file):
 
 if __name__ == "__main__":
     # main execution starts here
+    arg_parser = argparse.ArgumentParser(description="Convert MoMo SMS XML backup to JSON")
+    arg_parser.add_argument('--profile', nargs='?', const='dsa/profile_report.json', default=None,
+                            metavar='REPORT', help="record per-stage timings and write a JSON report "
+                                                   "(default: dsa/profile_report.json)")
+    arg_parser.add_argument('--cprofile', default=None, metavar='STATS',
+                            help="also dump cProfile stats to this file (load it with pstats)")
+    args = arg_parser.parse_args()
+
     xml_file = "dsa/modified_sms_v2.xml"
     output_file = "api/transactions.json"
+
+    profiler = None
+    if args.profile or args.cprofile:
+        from etl_profiler import StageProfiler
+        profiler = StageProfiler()
+
+    cprof = None
+    if args.cprofile:
+        import cProfile
+        cprof = cProfile.Profile()
+        cprof.enable()
     
     print("Starting XML parsing...")
-    transactions = parse_xml_to_json(xml_file)
+    transactions = parse_xml_to_json(xml_file, profiler)
     
     if len(transactions) > 0:
-        save_to_json(transactions, output_file)
+        save_to_json(transactions, output_file, profiler)
         # show first few transactions to verify
         print(f"\nFirst 5 transactions:")
         print(json.dumps(transactions[:5], indent=2))
@@ -171,4 +228,15 @@ if __name__ == "__main__":
         for ttype, count in types.items():
             print(f"  {ttype}: {count}")
     else:
-        print("No transactions found or something went wrong")
\ No newline at end of file
+        print("No transactions found or something went wrong")
+
+    if cprof:
+        cprof.disable()
+        cprof.dump_stats(args.cprofile)
+        print(f"cProfile stats saved to {args.cprofile}")
+
+    if profiler:
+        report_file = args.profile or 'dsa/profile_report.json'
+        report = profiler.save_report(report_file)
+        profiler.print_summary(report)
+        print(f"Profile report saved to {report_file}")